@@ -1,17 +1,22 @@
+import codecs
+import copy
+import functools
+import hashlib
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from email import message_from_binary_file
 from email.message import Message as EmailMessage
+from email.parser import BytesParser
+from email.policy import compat32
 from email.utils import getaddresses, parseaddr, parsedate_to_datetime
+from io import BytesIO
 from typing import BinaryIO, Dict, List, Optional, Tuple, TypedDict, Union
 ENCODINGS = ("ascii", "utf-8", "utf-8-sig", "latin-1", "cp1252")
-content_types = {".gif":"image/gif",".doc": "application/msword",".jpg":"image/jpeg",".jpg":"image/jpeg",".png":"image/png",".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document", ".pdf": "application/pdf"}
-
-from mimetypes import guess_type
-
-
-
-from extract_msg import Message
+DECODE_CACHE_SIZE = 512
+DECODE_CACHE_MAX_BYTES = 5_000_000
+MAX_ATTACHMENT_BYTES = 25_000_000
+NAMES_ONLY = "names_only"
 
 
 
@@ -24,31 +29,64 @@ class Email(TypedDict):
     to: List[Dict[str, str]]
     cc: List[Dict[str, str]]
     attachment_names: List[str]
-    attachment_binaries: List[BinaryIO]
+    attachment_binaries: List[Optional[BinaryIO]]
     attachment_types: List[str]
+    truncated: bool
 
 
+_decode_cache: "OrderedDict[Tuple, Email]" = OrderedDict()
+_decode_cache_lock = threading.Lock()
+_codec_cache: Dict[str, codecs.CodecInfo] = {}
+_adapters: Dict[str, type] = {}
+# BytesParser keeps no state between parse() calls, so one instance is shared.
+_parser = BytesParser(policy=compat32)
 
 
-def extract_attachments_from_eml(message: EmailMessage, mail_data: Email) -> None:
-    """Extracts attachments from email message.
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(value: str) -> Union[datetime, str]:
+    """Parses an RFC 2822 date, caching the result.
 
 
     Args:
-        message (EmailMessage): Message to extract.
-        mail_data (Email): Dictionary to modify.
+        value (str): Date header value.
 
 
+    Returns:
+        Union[datetime, str]: Parsed date, empty string if there is none.
     """
-    for part in message.walk():
-        if part.get_content_disposition() == "attachment":
-            content_type = part.get_content_type()
-            bin_data = part.get_payload(decode=True)
-            name = part.get_filename()
-            if name is not None:
-                mail_data["attachment_names"].append(part.get_filename())
-                mail_data["attachment_binaries"].append(bin_data)
-                mail_data["attachment_types"].append(content_type)
+    return parsedate_to_datetime(value) if value else ""
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_address(value: str) -> Tuple[str, str]:
+    """Parses a single address header, caching the result.
+
+
+    Args:
+        value (str): Address header value.
+
+
+    Returns:
+        Tuple[str, str]: Name and SMTP address.
+    """
+    return parseaddr(value)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_address_list(values: Tuple[str, ...]) -> Tuple[Tuple[str, str], ...]:
+    """Parses address header values, caching the result.
+
+
+    Args:
+        values (Tuple[str, ...]): Address header values.
+
+
+    Returns:
+        Tuple[Tuple[str, str], ...]: Name and SMTP address of each address.
+    """
+    return tuple(getaddresses(values))
 
 
 
@@ -63,12 +101,12 @@ def extract_metadata_from_eml_header(message: EmailMessage, mail_data: Email) ->
 
 
     """
-    timestamp = parsedate_to_datetime(message.get("date", ""))
+    timestamp = parse_date(str(message.get("date", "")))
     mail_data["received_on"] = timestamp
     mail_data["subject"] = message.get("subject", "")
 
 
-    author_name, author_address = parseaddr(message.get("from", ""))
+    author_name, author_address = parse_address(str(message.get("from", "")))
     author_information = {"name": author_name, "smtp_address": author_address}
     mail_data["author"] = author_information
     mail_data["sender"] = author_information
@@ -95,35 +133,140 @@ def extract_address_list_from_eml(
     """
     mail_data[key] = [  # type: ignore
         {"name": name, "smtp_address": address}
-        for name, address in getaddresses(message.get_all(key, []))
+        for name, address in parse_address_list(
+            tuple(str(value) for value in message.get_all(key, []))
+        )
     ]
 
 
 
 
-def extract_body_from_eml(message: EmailMessage) -> str:
-    """Extracts payload from email message.
+def extract_attachment_from_eml(
+    part: EmailMessage,
+    mail_data: Email,
+    read_attachments: Optional[Union[bool, str]],
+    max_attachment_bytes: int,
+) -> Optional[Tuple[str, Optional[bytes], str]]:
+    """Extracts an attachment record from an attachment part.
 
 
     Args:
-        message (EmailMessage): Message to extract.
+        part (EmailMessage): Attachment part to extract.
+        mail_data (Email): Dictionary to flag as truncated.
+        read_attachments (Optional[Union[bool, str]]): True or NAMES_ONLY.
+        max_attachment_bytes (int): Size limit of a single attachment.
 
 
     Returns:
-        str: Extracted message body.
+        Optional[Tuple[str, Optional[bytes], str]]: Name, binary and type, None if unnamed.
     """
-    body = ""
-    if message.is_multipart():
-        for part in message.walk():
-            main_type = part.get_content_maintype()
-            content_disposition = part.get_content_disposition()
-            if main_type == "text" and content_disposition != "attachment":
-                charset = get_charset(part)
-                body = part.get_payload(decode=True).strip().decode(charset)
+    name = part.get_filename()
+    if name is None:
+        return None
+    if read_attachments == NAMES_ONLY:
+        bin_data = None
+    elif estimate_payload_size(part) > max_attachment_bytes:
+        bin_data = None
+        mail_data["truncated"] = True
     else:
-        charset = get_charset(message)
-        body = message.get_payload(decode=True).strip().decode(charset)
-    return body
+        bin_data = part.get_payload(decode=True)
+    return name, bin_data, part.get_content_type()
+
+
+
+
+def store_attachments(
+    attachments: List[Tuple[str, Optional[bytes], str]], mail_data: Email
+) -> None:
+    """Stores attachment records into the parallel attachment lists.
+
+
+    Args:
+        attachments (List[Tuple[str, Optional[bytes], str]]): Name, binary and type of each attachment.
+        mail_data (Email): Dictionary to modify.
+
+
+    """
+    if attachments:
+        names, binaries, types = zip(*attachments)
+        mail_data["attachment_names"].extend(names)
+        mail_data["attachment_binaries"].extend(binaries)
+        mail_data["attachment_types"].extend(types)
+
+
+def lookup_codec(charset: str) -> codecs.CodecInfo:
+    """Looks up the codec of a charset label, caching the result by raw label.
+
+
+    Args:
+        charset (str): Charset name or alias, as found in the header.
+
+
+    Returns:
+        codecs.CodecInfo: Codec for the charset.
+    """
+    codec = _codec_cache.get(charset)
+    if codec is None:
+        codec = _codec_cache[charset] = codecs.lookup(charset.strip().lower())
+    return codec
+
+
+def estimate_payload_size(part: EmailMessage) -> int:
+    """Estimates the decoded payload size of a part without decoding it.
+
+    The estimate is never smaller than the decoded size.
+
+
+    Args:
+        part (EmailMessage): Part to measure.
+
+
+    Returns:
+        int: Upper bound of the decoded payload size in bytes.
+    """
+    if part.is_multipart():
+        return 0
+    payload = part.get_payload()
+    if str(part.get("content-transfer-encoding", "")).strip().lower() == "base64":
+        # Only the tail is stripped, to count padding without copying the payload.
+        tail = payload[-16:].rstrip()
+        padding = 2 if tail.endswith("==") else 1 if tail.endswith("=") else 0
+        size = len(payload) - payload.count("\n") - payload.count("\r")
+        return size * 3 // 4 - padding
+    return len(payload)
+
+
+def guess_attachment_type(name: str) -> str:
+    """Guesses the content type of an attachment from its file name.
+
+
+    Args:
+        name (str): Attachment file name.
+
+
+    Returns:
+        str: Content type, "None" if unknown.
+    """
+    root, extension = os.path.splitext(name)
+    # Keep the previous suffix too, for compound extensions such as .tar.gz.
+    return guess_extension_type(os.path.splitext(root)[1] + extension)
+
+
+@functools.lru_cache(maxsize=256)
+def guess_extension_type(extension: str) -> str:
+    """Guesses the content type of a file extension, caching the result.
+
+
+    Args:
+        extension (str): File extension, including the leading dot.
+
+
+    Returns:
+        str: Content type, "None" if unknown.
+    """
+    from mimetypes import guess_type
+
+    return str(guess_type("attachment" + extension)[0])
 
 
 def get_charset(part: EmailMessage) -> str:
@@ -137,10 +280,7 @@ def get_charset(part: EmailMessage) -> str:
     Returns:
         str: Charset from header.
     """
-    try:
-        return part.get_params()[1][1]
-    except IndexError:
-        return "utf-8"
+    return part.get_content_charset("utf-8")
 
 
 class MailAdapter:
@@ -150,20 +290,25 @@ class MailAdapter:
     supported_extension: str = ""
 
 
+    def __init_subclass__(cls, **kwargs):
+        """Register the subclass for its supported extension."""
+
+
+        super().__init_subclass__(**kwargs)
+        if not cls.supported_extension:
+            raise RuntimeError("Supported formats property is needed")
+        _adapters[cls.supported_extension.lower()] = cls
+
+
     def __new__(cls, file: BinaryIO):
         """Create instance of appropriate subclass using the extensions property."""
 
 
-        _, file_extension = os.path.splitext(file.name)
-        if file_extension not in [".eml",".msg"]:
+        file_extension = os.path.splitext(file.name)[1].lower()
+        subclass = _adapters.get(file_extension)
+        if subclass is None:
             raise ValueError(f"Unsupported mail extension {file_extension} given.")
-        if cls is MailAdapter:
-            for subclass in MailAdapter.__subclasses__():
-                if not subclass.supported_extension:
-                    raise RuntimeError("Supported formats property is needed")
-                if file_extension == subclass.supported_extension:
-                    return super().__new__(subclass)
-        return super().__new__(cls)
+        return super().__new__(subclass if cls is MailAdapter else cls)
 
 
     def __init__(self, file: BinaryIO):
@@ -179,11 +324,81 @@ class MailAdapter:
             "attachment_names": [],
             "attachment_binaries": [],
             "attachment_types": [],
+            "truncated": False,
         }
 
 
-    def decode(self, read_attachments: Optional[bool] = True):
-        """Abstract method for decoding a file and extracting email."""
+    def decode(
+        self,
+        read_attachments: Optional[Union[bool, str]] = True,
+        max_attachment_bytes: int = MAX_ATTACHMENT_BYTES,
+        metadata_only: bool = False,
+    ) -> Optional[Email]:
+        """Decodes the file, reusing the result of a previously decoded identical file.
+
+        Files larger than DECODE_CACHE_MAX_BYTES are always decoded and never cached.
+        Attachments larger than max_attachment_bytes are not read: their binary is
+        None and the email is flagged as truncated.
+
+        Args:
+            read_attachments (Optional[Union[bool, str]]): Include attachments,
+                or only their names and types with NAMES_ONLY.
+            max_attachment_bytes (int): Size limit of a single attachment.
+            metadata_only (bool): Only extract header metadata, skipping body
+                and attachments.
+
+        Returns:
+            Optional[Email]: Extracted email, None if decoding failed.
+        """
+        try:
+            blob = self.file.read()
+            if len(blob) > DECODE_CACHE_MAX_BYTES:
+                return self._decode_bytes(
+                    blob, read_attachments, max_attachment_bytes, metadata_only
+                )
+
+            key = (
+                type(self),
+                hashlib.blake2b(blob, digest_size=16).digest(),
+                read_attachments,
+                max_attachment_bytes,
+                metadata_only,
+            )
+            with _decode_cache_lock:
+                cached = _decode_cache.get(key)
+                if cached is not None:
+                    _decode_cache.move_to_end(key)
+            if cached is not None:
+                self.mail_data = copy.deepcopy(cached)
+                return self.mail_data
+
+            mail_data = self._decode_bytes(
+                blob, read_attachments, max_attachment_bytes, metadata_only
+            )
+            # Only plain bytes are cached: .msg attachments may be extract_msg
+            # objects backed by the OLE file, too costly to copy and keep alive.
+            if mail_data is not None and all(
+                bin_data is None or isinstance(bin_data, bytes)
+                for bin_data in mail_data["attachment_binaries"]
+            ):
+                cached = copy.deepcopy(mail_data)
+                with _decode_cache_lock:
+                    _decode_cache[key] = cached
+                    if len(_decode_cache) > DECODE_CACHE_SIZE:
+                        _decode_cache.popitem(last=False)
+            return mail_data
+        except Exception:
+            return None
+
+
+    def _decode_bytes(
+        self,
+        blob: bytes,
+        read_attachments: Optional[Union[bool, str]],
+        max_attachment_bytes: int,
+        metadata_only: bool,
+    ) -> Optional[Email]:
+        """Abstract method for extracting email from the raw file content."""
         raise NotImplementedError()
 
 
@@ -193,52 +408,130 @@ class EmlAdapter(MailAdapter):
     supported_extension = ".eml"
 
 
-    def decode(self, read_attachments: Optional[bool] = True) -> Optional[Email]:
+    def _decode_bytes(
+        self,
+        blob: bytes,
+        read_attachments: Optional[Union[bool, str]],
+        max_attachment_bytes: int,
+        metadata_only: bool,
+    ) -> Optional[Email]:
         try:
-            return self._decode_from_file(self.file, read_attachments)
+            return self._decode_from_file(
+                BytesIO(blob), read_attachments, max_attachment_bytes, metadata_only
+            )
         except Exception:
             return None
 
 
     def _decode_from_file(
-        self, file: BinaryIO, read_attachments: Optional[bool]
+        self,
+        file: BinaryIO,
+        read_attachments: Optional[Union[bool, str]],
+        max_attachment_bytes: int,
+        metadata_only: bool,
     ) -> Email:
         """Decodes from .eml file.
 
 
         Args:
             file (BinaryIO): File to extract.
-            read_attachments (Optional[bool]): Include attachments.
+            read_attachments (Optional[Union[bool, str]]): Include attachments.
+            max_attachment_bytes (int): Size limit of a single attachment.
+            metadata_only (bool): Only extract header metadata.
 
 
         Returns:
             Email: Extracted email.
         """
         mail_data = self.mail_data
-        message = message_from_binary_file(file)
+        message = _parser.parse(file, headersonly=metadata_only)
         extract_metadata_from_eml_header(message, mail_data)
-
-
-        mail_data["body"] = extract_body_from_eml(message)
-
-
-        if read_attachments is True:
-            extract_attachments_from_eml(message, mail_data)
+        if metadata_only:
+            return mail_data
+
+
+        read_attachment_names = (
+            read_attachments is True or read_attachments == NAMES_ONLY
+        )
+        if not message.is_multipart():
+            payload = message.get_payload(decode=True)
+            mail_data["body"] = payload.decode(get_charset(message)).strip()
+            if (
+                read_attachment_names
+                and message.get_content_disposition() == "attachment"
+            ):
+                attachment = extract_attachment_from_eml(
+                    message, mail_data, read_attachments, max_attachment_bytes
+                )
+                store_attachments([attachment] if attachment else [], mail_data)
+            return mail_data
+
+
+        plain = None
+        html = None
+        attachments = []
+        add_attachment = attachments.append
+        for part in message.walk():
+            if part.get_content_disposition() == "attachment":
+                if read_attachment_names:
+                    attachment = extract_attachment_from_eml(
+                        part, mail_data, read_attachments, max_attachment_bytes
+                    )
+                    if attachment is not None:
+                        add_attachment(attachment)
+                continue
+            content_type = part.get_content_type()
+            if content_type == "text/plain":
+                if plain is None:
+                    plain = part
+                    if not read_attachment_names:
+                        break
+            elif content_type == "text/html":
+                if html is None:
+                    html = part
+
+
+        body_part = plain if plain is not None else html
+        if body_part is not None:
+            payload = body_part.get_payload(decode=True)
+            mail_data["body"] = payload.decode(get_charset(body_part)).strip()
+        store_attachments(attachments, mail_data)
         return mail_data
 def decode_msg_body(
-    body: Union[str, bytes], encodings: Tuple[str, ...] = ENCODINGS
+    body: Union[str, bytes],
+    encodings: Tuple[str, ...] = ENCODINGS,
+    declared_charset: Optional[str] = None,
 ) -> str:
     """Decodes message body based on different encodings.
 
+    The charset declared by the sender is tried first, then UTF-8. Otherwise
+    the encoding is detected in a single pass with charset_normalizer, falling
+    back to trying each of `encodings` when it cannot tell.
+
     Args:
         body (Union[str, bytes]): Body to decode.
-        encodings (Tuple[str, ...], optional): Encodings to try.
+        encodings (Tuple[str, ...], optional): Fallback encodings to try.
+        declared_charset (Optional[str], optional): Charset from the message header.
 
     Returns:
         str: Decoded body.
     """
     if isinstance(body, str):
         return body
+    if declared_charset:
+        try:
+            return body.decode(lookup_codec(declared_charset).name)
+        except (LookupError, UnicodeDecodeError):
+            pass
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    import charset_normalizer
+
+    best = charset_normalizer.from_bytes(body).best()
+    if best is not None:
+        return str(best)
     for encoding in encodings:
         try:
             return body.decode(encoding)
@@ -251,120 +544,76 @@ def decode_msg_body(
 class MsgAdapter(MailAdapter):
     supported_extension = ".msg"
 
-    def decode(self, read_attachments: Optional[bool] = True) -> Optional[Email]:
+    def _decode_bytes(
+        self,
+        blob: bytes,
+        read_attachments: Optional[Union[bool, str]],
+        max_attachment_bytes: int,
+        metadata_only: bool,
+    ) -> Optional[Email]:
         try:
-            return self._decode_from_file(self.file, read_attachments)
+            return self._decode_from_blob(
+                blob, read_attachments, max_attachment_bytes, metadata_only
+            )
         except Exception as e:
             print(e)
             return None
 
-    def _decode_from_file(
-        self, file: BinaryIO, read_attachments: Optional[bool]
+    def _decode_from_blob(
+        self,
+        mail: bytes,
+        read_attachments: Optional[Union[bool, str]],
+        max_attachment_bytes: int,
+        metadata_only: bool,
     ) -> Email:
-        """Decodes from .msg file.
+        """Decodes from .msg file content.
 
         Args:
-            file (BinaryIO): File to extract.
-            read_attachments (Optional[bool]): Include attachments.
+            mail (bytes): File content to extract.
+            read_attachments (Optional[Union[bool, str]]): Include attachments.
+            max_attachment_bytes (int): Size limit of a single attachment.
+            metadata_only (bool): Only extract header metadata.
 
         Returns:
             Email: Extracted email.
         """
+        # Imported here so that .eml-only workloads don't pay for extract_msg.
+        # charset_normalizer is needed by decode_msg_body; importing it up front
+        # makes a missing install fail every .msg file, not only non-UTF-8 ones.
+        import charset_normalizer  # noqa: F401
+        from extract_msg import Message
 
-        mail = file.read()
         mail_data = self.mail_data
 
         message = Message(mail)
 
         extract_metadata_from_eml_header(message.header, mail_data)
+        if metadata_only:
+            return mail_data
 
         if message.body is not None:
-            mail_data["body"] = decode_msg_body(message.body).strip("\x00")
+            mail_data["body"] = decode_msg_body(
+                message.body, declared_charset=message.header.get_content_charset()
+            ).strip("\x00")
 
-        if read_attachments is True:
+        if read_attachments is True or read_attachments == NAMES_ONLY:
+            attachments = []
+            add_attachment = attachments.append
             for attachment in message.attachments:
                 name = attachment.shortFilename
                 if name is not None:
-                    content_type = str(guess_type(name)[0])
-                    bin_data = attachment.data
-                    mail_data["attachment_names"].append(name)
-                    mail_data["attachment_binaries"].append(bin_data)
-                    mail_data["attachment_types"].append(content_type)
+                    content_type = guess_attachment_type(name)
+                    if read_attachments == NAMES_ONLY:
+                        bin_data = None
+                    else:
+                        bin_data = attachment.data
+                        if (
+                            isinstance(bin_data, bytes)
+                            and len(bin_data) > max_attachment_bytes
+                        ):
+                            bin_data = None
+                            mail_data["truncated"] = True
+                    add_attachment((name, bin_data, content_type))
+            store_attachments(attachments, mail_data)
 
         return mail_data
-    
-content_types = {".aac":"audio/aac",
-".abw":"application/x-abiword",
-".arc":"application/x-freearc",
-".avif":"image/avif",
-".avi":"video/x-msvideo",
-".azw":"application/vnd.amazon.ebook",
-".bin":"application/octet-stream",
-".bmp":"image/bmp",
-".bz":"application/x-bzip",
-".bz2":"application/x-bzip2",
-".cda":"application/x-cdf",
-".csh":"application/x-csh",
-".css":"text/css",
-".csv":"text/csv",
-".doc":"application/msword",
-".docx":"application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-".eot":"application/vnd.ms-fontobject",
-".epub":"application/epub+zip",
-".gz":"application/gzip",
-".gif":"image/gif",
-".htm":"text/html",
-".ico":"image/vnd.microsoft.icon",
-".ics":"text/calendar",
-".jar":"application/java-archive",
-".jpeg":"image/jpeg",
-".js":"text/javascript",
-".json":"application/json",
-".jsonld":"application/ld+json",
-".mid":"audio/midi audio/x-midi",
-".mjs":"text/javascript",
-".mp3":"audio/mpeg",
-".mp4":"video/mp4",
-".mpeg":"video/mpeg",
-".mpkg":"application/vnd.apple.installer+xml",
-".odp":"application/vnd.oasis.opendocument.presentation",
-".ods":"application/vnd.oasis.opendocument.spreadsheet",
-".odt":"application/vnd.oasis.opendocument.text",
-".oga":"audio/ogg",
-".ogv":"video/ogg",
-".ogx":"application/ogg",
-".opus":"audio/opus",
-".otf":"font/otf",
-".png":"image/png",
-".pdf":"application/pdf",
-".php":"application/x-httpd-php",
-".ppt":"application/vnd.ms-powerpoint",
-".pptx":"application/vnd.openxmlformats-officedocument.presentationml.presentation",
-".rar":"application/vnd.rar",
-".rtf":"application/rtf",
-".sh":"application/x-sh",
-".svg":"image/svg+xml",
-".swf":"application/x-shockwave-flash",
-".tar":"application/x-tar",
-".tif":"image/tiff",
-".ts":"video/mp2t",
-".ttf":"font/ttf",
-".txt":"text/plain",
-".vsd":"application/vnd.visio",
-".wav":"audio/wav",
-".weba":"audio/webm",
-".webm":"video/webm",
-".webp":"image/webp",
-".woff":"font/woff",
-".woff2":"font/woff2",
-".xhtml":"application/xhtml+xml",
-".xls":"application/vnd.ms-excel",
-".xlsx":"application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-".xml":"application/xml",
-".xul":"application/vnd.mozilla.xul+xml",
-".zip":"application/zip",
-".3gp":"audio/video",
-".3g2":"audio/video",
-".7z":"application/x-7z-compressed"}
-
-